@@ -103,3 +103,30 @@ def test_predict_sam():
 
     # Reset image
     predictor.reset_image()
+
+
+@pytest.mark.skipif(not CUDA_IS_AVAILABLE, reason='CUDA is not available')
+def test_dwa_process_batch_graph(tmp_path):
+    """Test that DWAValidator CUDA graph replay matches eager matching, including padded detections and labels."""
+    from ultralytics.models.yolo.dwa import DWAValidator
+    from ultralytics.utils.metrics import box_iou_2d
+
+    if torch.cuda.get_device_capability(0)[0] < 7:
+        pytest.skip('CUDA graph capture requires compute capability 7.0 or higher')
+    validator = DWAValidator(save_dir=tmp_path)
+    validator.device = torch.device('cuda:0')
+    validator.iouv = validator.iouv.to(validator.device)
+    validator._capture_process_batch()
+    assert validator._graph is not None
+
+    torch.manual_seed(0)
+    for n, m in [(1, 1), (1, 9), (9, 1), (40, 25), (validator.args.max_det, validator._graph_max_labels)]:
+        xy = torch.rand(m, 2, device=validator.device) * 600
+        labels = torch.cat((torch.randint(3, (m, 1), device=validator.device).float(), xy, xy + 40), 1)
+        boxes = labels[torch.randint(m, (n, )), 1:] + torch.randn(n, 4, device=validator.device) * 8  # near labels
+        detections = torch.cat((boxes, torch.rand(n, 1, device=validator.device),
+                                torch.randint(3, (n, 1), device=validator.device).float()), 1)
+        correct, idx = validator._process_batch(detections, labels)  # graph replay
+        correct_eager, idx_eager = validator._match(detections, labels, box_iou_2d)
+        assert torch.equal(correct, correct_eager)
+        assert torch.equal(idx, idx_eager)
@@ -0,0 +1,122 @@
+# Ultralytics YOLO 🚀, AGPL-3.0 license
+
+import numpy as np
+import torch
+
+from ultralytics.engine.validator import BaseValidator
+from ultralytics.models.yolo.dwa import DWAValidator
+from ultralytics.utils import ops
+from ultralytics.utils.metrics import ConfusionMatrix
+
+
+def _random_boxes(n, size=64):
+    """Return n random (x1, y1, x2, y2) boxes inside a size x size image."""
+    xy = torch.rand(n, 2) * size
+    return torch.cat((xy, xy + torch.rand(n, 2) * size / 2 + 4), 1)
+
+
+def test_confusion_matrix_process_batch_multi():
+    """Test that ConfusionMatrix.process_batch_multi matches per-image ConfusionMatrix.process_batch calls."""
+    torch.manual_seed(0)
+    nc = 3
+    nl = [3, 4, 0, 5, 1, 6]  # labels per image
+    nd = [0, 4, 3, 8, 2, 6]  # detections per image, image 0 has none and image 1 has only low confidence ones
+    for _ in range(10):
+        labels, detections = [], []
+        for i, (l, d) in enumerate(zip(nl, nd)):
+            label = torch.cat((torch.randint(nc, (l, 1)).float(), _random_boxes(l)), 1)
+            detection = torch.cat((_random_boxes(d), torch.rand(d, 1), torch.randint(nc, (d, 1)).float()), 1)
+            k = min(l, d)
+            detection[:k, :4] = label[:k, 1:] + torch.randn(k, 4) * 0.5  # jittered copies of the labels
+            if i == 1:
+                detection[:, 4] *= 0.2  # all below the 0.25 confusion matrix conf
+            labels.append(label)
+            detections.append(detection)
+
+        per_image = ConfusionMatrix(nc=nc)
+        for label, detection in zip(labels, detections):
+            if len(label) and len(detection):
+                per_image.process_batch(detection, label)
+            elif len(label):
+                per_image.process_batch(None, label[:, 0])  # as DWAValidator for images without detections
+
+        multi = ConfusionMatrix(nc=nc)
+        multi.process_batch_multi(torch.cat(detections), torch.cat(labels),
+                                  torch.arange(len(nd)).repeat_interleave(torch.tensor(nd)),
+                                  torch.arange(len(nl)).repeat_interleave(torch.tensor(nl)))
+        assert np.array_equal(multi.matrix, per_image.matrix)
+
+
+def test_dwa_match_predictions(tmp_path):
+    """Test that the vectorized DWAValidator.match_predictions matches the greedy BaseValidator.match_predictions."""
+    torch.manual_seed(0)
+    validator = DWAValidator(save_dir=tmp_path)
+    grid = torch.arange(21) / 20  # IoU values on a grid, so detections tie with each other and with the thresholds
+    for m, n in [(1, 1), (1, 7), (6, 1), (4, 5), (12, 30), (20, 100)]:
+        for _ in range(20):
+            # Distinct values within each column: which label a detection picks among equal IoUs is left to the sort
+            # order in BaseValidator, but ties between detections for the same label are resolved by detection index
+            iou = torch.stack([grid[torch.randperm(len(grid))[:m]] for _ in range(n)], 1)  # MxN
+            pred_classes, true_classes = torch.randint(3, (n, )).float(), torch.randint(3, (m, )).float()
+            expected = BaseValidator.match_predictions(validator, pred_classes, true_classes, iou)
+            assert torch.equal(validator.match_predictions(pred_classes, true_classes, iou), expected)
+
+
+def test_dwa_packbits(tmp_path):
+    """Test DWAValidator attribute bit-packing against np.unpackbits, on its own and through get_stats()."""
+    torch.manual_seed(0)
+    validator = DWAValidator(save_dir=tmp_path)
+    validator.device = torch.device('cpu')
+    validator._bit_weights = 2 ** torch.arange(8, dtype=torch.uint8)
+    for n, a in [(0, 5), (0, 8), (0, 13), (6, 5), (6, 8), (6, 13)]:
+        x = torch.rand(n, a) > 0.5
+        packed = validator._packbits(x)
+        assert packed.shape == (n, (a + 7) // 8) and packed.dtype == torch.uint8
+        assert np.array_equal(np.unpackbits(packed.numpy(), axis=1, count=a, bitorder='little').astype(bool), x.numpy())
+
+    # Round-trip through get_stats(), with one image without labels
+    nc, a, nl = 2, 13, [3, 0, 4]
+    validator.nc, validator.num_attrs = nc, a
+    validator.metrics.names, validator.metrics.attr_names = {0: 'a', 1: 'b'}, [str(i) for i in range(a)]
+    validator.stats = dict(tp=[], attr_preds=[], attr_targets=[], conf=[], pred_cls=[], target_cls=[])
+    attr_preds, attr_targets = torch.rand(sum(nl), a) > 0.5, torch.rand(sum(nl), a) > 0.5
+    for preds, targets in zip(attr_preds.split(nl), attr_targets.split(nl)):
+        m = len(targets)
+        validator._append_stats(torch.ones(m, 10, dtype=torch.bool), validator._packbits(preds),
+                                validator._packbits(targets), torch.rand(m), torch.randint(nc, (m, )).float(),
+                                torch.randint(nc, (m, )).float())
+    stats = {}
+    process = validator.metrics.process
+    validator.metrics.process = lambda **kwargs: stats.update(kwargs) or process(**kwargs)
+    validator.get_stats()
+    assert np.array_equal(stats['attr_preds'], attr_preds.numpy())
+    assert np.array_equal(stats['attr_targets'], attr_targets.numpy())
+    assert np.array_equal(validator.nt_per_attrs, attr_targets.numpy().sum(0))
+
+
+def test_dwa_native_boxes(tmp_path):
+    """Test batched native-space box rescaling against per-image ops.scale_boxes, as in DetectionValidator."""
+    torch.manual_seed(0)
+    validator = DWAValidator(save_dir=tmp_path)
+    validator.device = torch.device('cpu')
+    height, width = 64, 96  # letterboxed batch image shape
+    ori_shapes = [(480, 640), (640, 480), (96, 96), (30, 200)]  # (h0, w0), each with a different gain and padding
+    ratio_pads = []
+    for h0, w0 in ori_shapes:
+        gain = min(height / h0, width / w0)
+        pad = round((width - w0 * gain) / 2 - 0.1), round((height - h0 * gain) / 2 - 0.1)
+        ratio_pads.append(((gain, gain), pad))
+    ratio_pad = validator._ratio_pad(dict(ratio_pad=ratio_pads, ori_shape=ori_shapes))
+
+    n = [5, 0, 3, 7]  # boxes per image
+    idx = torch.arange(len(n)).repeat_interleave(torch.tensor(n))
+    xywhn = torch.cat((torch.rand(sum(n), 2) * 1.2 - 0.1, torch.rand(sum(n), 2) * 0.6), 1)  # some need clipping
+    whwh = torch.tensor((width, height, width, height)).float()
+    labels = ops.xywhn2xyxy_batch(xywhn, whwh, ratio_pad[idx])
+    boxes = ops.xywh2xyxy(xywhn) * whwh  # letterbox-space (x1, y1, x2, y2)
+    predictions = ops.scale_boxes_batch(boxes, ratio_pad[idx])
+    for i, (b, shape, rp) in enumerate(zip(boxes.split(n), ori_shapes, ratio_pads)):
+        expected = ops.scale_boxes((height, width), b.clone(), shape, ratio_pad=rp)
+        assert torch.allclose(labels[idx == i], expected, atol=1e-3)
+        assert torch.allclose(predictions[idx == i], expected, atol=1e-3)
+    assert (labels[:, :2] == 0).any() and (labels[:, 2:] == ratio_pad[idx, 3:].flip(1)).any()  # clipping covered
@@ -6,9 +6,10 @@ import numpy as np
 import torch
 
 from ultralytics.models.yolo.detect import DetectionValidator
-from ultralytics.utils import LOGGER, ops
-from ultralytics.utils.metrics import DWAMetrics, box_iou
+from ultralytics.utils import LOGGER, WINDOWS, ops
+from ultralytics.utils.metrics import DWAMetrics, box_iou_2d, box_iou_np
 from ultralytics.utils.plotting import output_to_target, plot_images
+from ultralytics.utils.torch_utils import TORCH_2_1
 
 
 class DWAValidator(DetectionValidator):
@@ -29,6 +30,13 @@ class DWAValidator(DetectionValidator):
         """Initialize a 'PoseValidator' object with custom parameters and assigned attributes."""
         super().__init__(dataloader, save_dir, pbar, args, _callbacks)
         self.num_attrs = None
+        # replaced by compiled versions on CUDA with compile_val=True
+        self._box_iou, self._scale_boxes, self._xywhn2xyxy = box_iou_2d, ops.scale_boxes_batch, ops.xywhn2xyxy_batch
+        self._compile_failed = False  # torch.compile is not retried after a failure
+        self._graph = None  # CUDA graph of _process_batch, see _capture_process_batch()
+        self._graph_max_labels = 100  # images with more labels fall back to eager
+        self._graph_failed = False  # graph capture is not retried after a failure
+        self._plot_threads = []  # background plot_images() threads, joined in print_results()
         self.args.task = 'dwa'
         self.metrics = DWAMetrics(save_dir=self.save_dir, on_plot=self.on_plot)
         if isinstance(self.args.device, str) and self.args.device.lower() == 'mps':
@@ -63,63 +71,149 @@ class DWAValidator(DetectionValidator):
         super().init_metrics(model)
         self.num_attrs = self.data['num_attr']
         self.metrics.attr_names = self.data['attr_names']
+        # per-image device tensors, concatenated and moved to CPU once per field in get_stats()
+        self.stats = dict(tp=[], attr_preds=[], attr_targets=[], conf=[], pred_cls=[], target_cls=[])
+        self._whwh = {}  # (width, height) -> whwh gain tensor, reused across batches of the same image size
+        self._bit_weights = 2 ** torch.arange(8, dtype=torch.uint8, device=self.device)  # see _packbits()
+        self.iouv = self.iouv.to(self.device)
+        self._capture_process_batch()
+        self._compile_ops()
+
+    def _compile_ops(self):
+        """
+        Compile the batch tensor ops with torch.compile if `compile_val=True`, on CUDA and torch>=2.1, else keep eager.
+
+        IoU is only compiled without a captured CUDA graph, since the graph already replays eager `box_iou_2d` kernels.
+        """
+        if not (self.args.compile_val and TORCH_2_1 and self.device.type == 'cuda' and not WINDOWS) or \
+                self._compile_failed or self._scale_boxes is not ops.scale_boxes_batch:
+            return
+        try:
+            box_iou = box_iou_2d if self._graph is not None else torch.compile(box_iou_2d, dynamic=True)
+            scale_boxes = torch.compile(ops.scale_boxes_batch, dynamic=True)
+            xywhn2xyxy = torch.compile(ops.xywhn2xyxy_batch, dynamic=True)
+            boxes = torch.tensor([[0., 0., 8., 8.], [4., 4., 12., 12.]], device=self.device)
+            ratio_pad = torch.tensor([[1., 0., 0., 16., 16.]], device=self.device).expand(2, 5)
+            box_iou(boxes, boxes)  # warmup
+            scale_boxes(boxes, ratio_pad)
+            xywhn2xyxy(boxes / 16, torch.tensor((16., 16., 16., 16.), device=self.device), ratio_pad)
+            self._box_iou, self._scale_boxes, self._xywhn2xyxy = box_iou, scale_boxes, xywhn2xyxy
+        except Exception as e:
+            self._compile_failed = True
+            LOGGER.warning(f'WARNING ⚠️ torch.compile failed, using eager validation ops: {e}')
+
+    def _capture_process_batch(self):
+        """
+        Capture `_process_batch` as a CUDA graph on inputs padded to `max_det` detections and `_graph_max_labels`
+        labels, so each image replays one graph instead of launching every IoU and matching kernel.
+
+        Padded detections and labels are zero-area boxes with different sentinel classes, so they have zero IoU, never
+        match, and never win `argmax` over a real detection. Requires compute capability 7.0 or higher.
+
+        Capture uses the 'thread_local' error mode, since DataLoader worker and pin-memory threads may still be making
+        CUDA calls when validation starts.
+        """
+        if self.device.type != 'cuda' or self._graph_failed or torch.cuda.get_device_capability(self.device)[0] < 7 or \
+                (self._graph is not None and self._graph_inputs[0].device == self.device):
+            return
+        self._graph = None
+        try:
+            detections = torch.zeros(self.args.max_det, 6, device=self.device)
+            labels = torch.zeros(self._graph_max_labels, 5, device=self.device)
+            detections[:, 5], labels[:, 0] = -1, -2  # sentinel classes that never match
+            self._graph_inputs = detections, labels
+            self._graph_padding = detections.clone(), labels.clone()
+            stream = torch.cuda.Stream(self.device)
+            stream.wait_stream(torch.cuda.current_stream(self.device))
+            with torch.cuda.stream(stream):
+                for _ in range(3):  # warmup on a side stream before capture
+                    self._match(detections, labels, box_iou_2d)
+            torch.cuda.current_stream(self.device).wait_stream(stream)
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph, capture_error_mode='thread_local'):
+                self._graph_outputs = self._match(detections, labels, box_iou_2d)
+            self._graph = graph
+        except Exception as e:
+            self._graph_failed = True
+            LOGGER.warning(f'WARNING ⚠️ CUDA graph capture failed, using eager validation ops: {e}')
 
     def update_metrics(self, preds, batch):
         """Metrics."""
-        for si, pred in enumerate(preds):
-            idx = batch['batch_idx'] == si
-            cls = batch['cls'][idx]
-            bbox = batch['bboxes'][idx]
-            attributes = batch['attributes'][idx]
-            num_attr = attributes.shape[1]
-            nl, npr = cls.shape[0], pred.shape[0]  # number of labels, predictions
-            shape = batch['ori_shape'][si]
-            correct_bboxes = torch.zeros(npr, self.niou, dtype=torch.bool, device=self.device)  # init
+        height, width = batch['img'].shape[2:]
+        ratio_pad = self._ratio_pad(batch)  # per-image (gain, pad_w, pad_h, h0, w0)
+
+        # Labels, native-space for the whole batch at once
+        batch_idx = batch['batch_idx'].long()
+        if (width, height) not in self._whwh:
+            self._whwh[width, height] = torch.tensor((width, height, width, height), device=self.device).float()
+        tbox = self._xywhn2xyxy(batch['bboxes'], self._whwh[width, height], ratio_pad[batch_idx])
+        tattributes = self._packbits(batch['attributes'] != 0)  # nonzero is positive, as .bool()
+
+        # Predictions, native-space for the whole batch at once
+        if self.args.single_cls:
+            for pred in preds:
+                pred[:, 5] = 0  # in place, so plot_predictions() also shows class 0
+        npr = [pred.shape[0] for pred in preds]  # number of predictions per image
+        pred_idx = torch.arange(len(preds), device=self.device).repeat_interleave(
+            torch.tensor(npr, device=self.device), output_size=sum(npr))  # image index of each prediction, no sync
+        detections = torch.cat([pred[:, :6] for pred in preds], 0)  # (x1, y1, x2, y2, conf, class), no attributes
+        detections[:, :4] = self._scale_boxes(detections[:, :4], ratio_pad[pred_idx])  # native-space pred boxes
+        if self.args.plots:
+            labelsn = torch.cat((batch['cls'], tbox), 1)  # native-space labels
+            self.confusion_matrix.process_batch_multi(detections, labelsn, pred_idx, batch_idx)
+
+        # Labels are grouped by image in collate_fn, so each image's labels are one contiguous slice
+        nl = torch.bincount(batch_idx, minlength=len(npr)).tolist()  # number of labels per image
+        labels = zip(batch['cls'].split(nl), tbox.split(nl), tattributes.split(nl))
+        empty_attr = self._packbits(torch.zeros(0, self.num_attrs, dtype=torch.bool, device=self.device))
+        for si, (pred, predn, (cls, bbox, attributes)) in enumerate(zip(preds, detections.split(npr), labels)):
+            pred_attr = pred[:, 6:]  # logits, sigmoid(x) > 0.5 is equivalent to x > 0
+            correct_bboxes = torch.zeros(npr[si], self.niou, dtype=torch.bool, device=self.device)  # init
             self.seen += 1
 
-            if npr == 0:
-                if nl:
-                    self.stats.append((correct_bboxes,
-                        torch.zeros(0, num_attr, device=self.device), 
-                        torch.zeros(0, num_attr, device=self.device),
-                                        *torch.zeros(
-                        (2, 0), device=self.device), cls.squeeze(-1)))
-                    if self.args.plots:
-                        self.confusion_matrix.process_batch(detections=None, labels=cls.squeeze(-1))
+            if npr[si] == 0:
+                if nl[si]:
+                    self._append_stats(correct_bboxes, empty_attr, empty_attr, *torch.zeros(
+                        (2, 0), device=self.device), cls.squeeze(-1))
                 continue
 
-            # Predictions
-            if self.args.single_cls:
-                pred[:, 5] = 0
-            predn = pred.clone()
-            ops.scale_boxes(batch['img'][si].shape[1:], predn[:, :4], shape,
-                            ratio_pad=batch['ratio_pad'][si])  # native-space pred
-            pred_attr = torch.sigmoid(predn[:, 6:])
-
             # Evaluate
-            if nl:
-                height, width = batch['img'].shape[2:]
-                tbox = ops.xywh2xyxy(bbox) * torch.tensor(
-                    (width, height, width, height), device=self.device)  # target boxes
-                ops.scale_boxes(batch['img'][si].shape[1:], tbox, shape,
-                                ratio_pad=batch['ratio_pad'][si])  # native-space labels
-                tattributes = attributes.clone().bool()
-                labelsn = torch.cat((cls, tbox), 1)  # native-space labels
-                correct_bboxes, idx = self._process_batch(predn[:, :6], labelsn)
-                pred_attr= pred_attr[idx] > 0.5
-                if self.args.plots:
-                    self.confusion_matrix.process_batch(predn, labelsn)
-                
-
-            # Append correct_masks, correct_boxes, pconf, pcls, tcls
-            self.stats.append((correct_bboxes, pred_attr, tattributes, pred[:, 4], pred[:, 5], cls.squeeze(-1)))
+            pred_attr_matched, tattr = empty_attr, empty_attr
+            if nl[si]:
+                labelsn = torch.cat((cls, bbox), 1)  # native-space labels
+                correct_bboxes, midx = self._process_batch(predn, labelsn)
+                pred_attr_matched, tattr = self._packbits(pred_attr.index_select(0, midx) > 0), attributes
+
+            # Append correct_bboxes, pred_attr, target_attr, pconf, pcls, tcls
+            self._append_stats(correct_bboxes, pred_attr_matched, tattr, pred[:, 4], pred[:, 5], cls.squeeze(-1))
 
             # Save
             if self.args.save_json:
-                self.pred_to_json(predn, batch['im_file'][si])
+                self.pred_to_json(torch.cat((predn, pred_attr), 1), batch['im_file'][si])
             # if self.args.save_txt:
             #    save_one_txt(predn, save_conf, shape, file=save_dir / 'labels' / f'{path.stem}.txt')
 
+    def _ratio_pad(self, batch):
+        """Return a tensor of shape (B, 5) holding (gain, pad_w, pad_h, h0, w0) for each image of the batch."""
+        return torch.tensor([(rp[0][0], *rp[1], *shape) for rp, shape in zip(batch['ratio_pad'], batch['ori_shape'])],
+                            device=self.device)
+
+    def _packbits(self, x):
+        """
+        Pack a boolean tensor of shape (N, A) into uint8 of shape (N, ceil(A / 8)) for compact stats storage.
+
+        Bits are packed in little-endian order so `np.unpackbits(..., bitorder='little')` restores them in get_stats().
+        """
+        n, a = x.shape
+        bits = torch.zeros(n, (a + 7) // 8 * 8, dtype=torch.uint8, device=x.device)
+        bits[:, :a] = x
+        return (bits.view(n, (a + 7) // 8, 8) * self._bit_weights).sum(-1, dtype=torch.uint8)
+
+    def _append_stats(self, *stats):
+        """Append one image's statistics, kept on device, in the field order of `self.stats`."""
+        for k, v in zip(self.stats, stats):
+            self.stats[k].append(v)
+
     def _process_batch(self, detections, labels):
         """
         Return correct prediction matrix.
@@ -129,37 +223,82 @@ class DWAValidator(DetectionValidator):
                 Each detection is of the format: x1, y1, x2, y2, conf, class.
             labels (torch.Tensor): Tensor of shape [M, 5] representing labels.
                 Each label is of the format: class, x1, y1, x2, y2.
-            pred_kpts (torch.Tensor, optional): Tensor of shape [N, 51] representing predicted attributes.
-            gt_kpts (torch.Tensor, optional): Tensor of shape [N, 51] representing ground truth attributes.
 
         Returns:
-            torch.Tensor: Correct prediction matrix of shape [N, 10] for 10 IoU levels.
+            (tuple): Correct prediction matrix of shape [N, 10] for 10 IoU levels, and index of the best matching
+                detection for each label of shape [M].
         """
-        
-        iou = box_iou(labels[:, 1:], detections[:, :4])
-        _, idx = iou.max(1)  # best iou for each label
+        n, m = len(detections), len(labels)
+        if self._graph is None or m > self._graph_max_labels:
+            return self._match(detections, labels, box_iou_np if labels.device.type == 'cpu' else self._box_iou)
 
+        # Replay the captured graph on padded static inputs
+        static_detections, static_labels = self._graph_inputs
+        static_detections[:n], static_labels[:m] = detections, labels
+        static_detections[n:], static_labels[m:] = self._graph_padding[0][n:], self._graph_padding[1][m:]
+        self._graph.replay()
+        correct, idx = self._graph_outputs
+        return correct[:n].clone(), idx[:m].clone()  # outputs are overwritten by the next replay
+
+    def _match(self, detections, labels, box_iou):
+        """Return correct prediction matrix and best matching detection for each label, see `_process_batch`."""
+        iou = box_iou(labels[:, 1:], detections[:, :4])
+        idx = iou.argmax(1)  # best iou for each label
         return self.match_predictions(detections[:, 5], labels[:, 0], iou), idx
 
+    def match_predictions(self, pred_classes, true_classes, iou, use_scipy=False):
+        """
+        Matches predictions to ground truth objects (pred_classes, true_classes) using IoU.
+
+        Vectorized on device over all IoU thresholds, with the same result as the greedy matching in
+        `BaseValidator.match_predictions`: at each threshold every detection keeps its highest-IoU label among the
+        candidates, then every label keeps the lowest-index detection that chose it.
+
+        Args:
+            pred_classes (torch.Tensor): Predicted class indices of shape(N,).
+            true_classes (torch.Tensor): Target class indices of shape(M,).
+            iou (torch.Tensor): An MxN tensor containing the pairwise IoU values for ground truth and predictions.
+            use_scipy (bool): Whether to use scipy for matching (more precise).
+
+        Returns:
+            (torch.Tensor): Correct tensor of shape(N,10) for 10 IoU thresholds.
+        """
+        if use_scipy:
+            return super().match_predictions(pred_classes, true_classes, iou, use_scipy=True)
+
+        n, m = pred_classes.shape[0], true_classes.shape[0]
+        if n == 0 or m == 0:
+            return torch.zeros(n, self.niou, dtype=torch.bool, device=pred_classes.device)
+        iou = iou * (true_classes[:, None] == pred_classes)  # zero out the wrong classes
+        best_iou, best_label = iou.max(0)  # highest-IoU label for each detection
+        alive = best_iou[:, None] >= self.iouv  # Nx10, detection has a candidate at each threshold
+        det_idx = torch.arange(n, device=iou.device)
+        own = best_label[:, None] == torch.arange(m, device=iou.device)  # NxM, label chosen by each detection
+        first = det_idx[:, None].expand(n, self.niou).masked_fill(~alive, n)  # Nx10, surviving detection indices
+        first = first[:, None].expand(n, m, self.niou).masked_fill(~own[..., None], n).amin(0)  # Mx10, per label
+        return first[best_label] == det_idx[:, None]
+
     def plot_val_samples(self, batch, ni):
         """Plots and saves validation set samples with predicted bounding boxes and attributes."""
-        plot_images(batch['img'],
-                    batch['batch_idx'],
-                    batch['cls'].squeeze(-1),
-                    batch['bboxes'],
-                    paths=batch['im_file'],
-                    fname=self.save_dir / f'val_batch{ni}_labels.jpg',
-                    names=self.names,
-                    on_plot=self.on_plot)
+        self._plot_threads.append(
+            plot_images(batch['img'],
+                        batch['batch_idx'],
+                        batch['cls'].squeeze(-1),
+                        batch['bboxes'],
+                        paths=batch['im_file'],
+                        fname=self.save_dir / f'val_batch{ni}_labels.jpg',
+                        names=self.names,
+                        on_plot=self.on_plot))
 
     def plot_predictions(self, batch, preds, ni):
         """Plots predictions for YOLO model."""
-        plot_images(batch['img'],
-                    *output_to_target(preds, max_det=self.args.max_det),
-                    paths=batch['im_file'],
-                    fname=self.save_dir / f'val_batch{ni}_pred.jpg',
-                    names=self.names,
-                    on_plot=self.on_plot)  # pred
+        self._plot_threads.append(
+            plot_images(batch['img'],
+                        *output_to_target(preds, max_det=self.args.max_det),
+                        paths=batch['im_file'],
+                        fname=self.save_dir / f'val_batch{ni}_pred.jpg',
+                        names=self.names,
+                        on_plot=self.on_plot))  # pred
 
     def pred_to_json(self, predn, filename):
         """Converts YOLO predictions to COCO JSON format."""
@@ -167,14 +306,22 @@ class DWAValidator(DetectionValidator):
         image_id = int(stem) if stem.isnumeric() else stem
         box = ops.xyxy2xywh(predn[:, :4])  # xywh
         box[:, :2] -= box[:, 2:] / 2  # xy center to top-left corner
-        for p, b in zip(predn.tolist(), box.tolist()):
-            self.jdict.append({
-                'image_id': image_id,
-                'category_id': self.class_map[int(p[5])],
-                'bbox': [round(x, 3) for x in b],
-                'attributes': p[6:],
-                'score': round(p[4], 5)})
-            
+        x = torch.cat((box, predn[:, 4:6], predn[:, 6:].sigmoid()), 1).cpu().double().numpy()  # single transfer
+        boxes, scores, classes, attributes = x[:, :4].round(3), x[:, 4].round(5), x[:, 5].astype(int), x[:, 6:]
+        self.jdict.extend({
+            'image_id': image_id,
+            'category_id': self.class_map[c],
+            'bbox': b,
+            'attributes': a,
+            'score': s} for b, c, a, s in zip(boxes.tolist(), classes.tolist(), attributes.tolist(), scores.tolist()))
+
+    @staticmethod
+    def _to_cpu(x):
+        """Start an asynchronous device-to-host copy of `x` into pinned memory, synchronize before reading it."""
+        if x.device.type != 'cuda':
+            return x.cpu()
+        return torch.empty(x.shape, dtype=x.dtype, pin_memory=True).copy_(x, non_blocking=True)
+
     def print_results(self):
         """Prints training/validation set metrics per class."""
         pf = '%22s' + '%11i' * 2 + '%11.3g' * len(self.metrics.keys)  # print format
@@ -185,15 +332,18 @@ class DWAValidator(DetectionValidator):
                 f'WARNING ⚠️ no labels found in {self.args.task} set, can not compute metrics without labels')
 
         # Print results per class
-        if self.args.verbose and not self.training and self.nc > 1 and len(self.stats):
+        if self.args.verbose and not self.training and self.nc > 1 and len(self.stats['tp']):
             for i, c in enumerate(self.metrics.ap_class_index):
                 LOGGER.info(pf % (self.names[c], self.seen, self.nt_per_class[c], *self.metrics.class_result(i), *empty))
         
-        if self.args.verbose and not self.training and self.num_attrs > 1 and len(self.stats):
+        if self.args.verbose and not self.training and self.num_attrs > 1 and len(self.stats['tp']):
             for i, c in enumerate(self.metrics.attr_names):
                 LOGGER.info(pf % (self.metrics.attr_names[i], self.seen, self.nt_per_attrs[i], *empty,*self.metrics.attr_class_result(i)))
 
         if self.args.plots:
+            for thread in self._plot_threads:  # wait for batch plots so all files exist when validation ends
+                thread.join()
+            self._plot_threads = []
             for normalize in True, False:
                 self.confusion_matrix.plot(save_dir=self.save_dir,
                                            names=self.names.values(),
@@ -202,11 +352,16 @@ class DWAValidator(DetectionValidator):
 
     def get_stats(self):
         """Returns metrics statistics and results dictionary."""
-        stats = [torch.cat(x, 0).cpu().numpy() for x in zip(*self.stats)]  # to numpy
-        if len(stats) and stats[0].any():
-            self.metrics.process(*stats)
-        self.nt_per_class = np.bincount(stats[-1].astype(int), minlength=self.nc)  # number of targets per class
-        self.nt_per_attrs = np.sum(stats[2], axis=0)  # number of targets per class
+        stats = {k: self._to_cpu(torch.cat(v, 0)) for k, v in self.stats.items()}  # overlapping transfers
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        stats = {k: v.numpy() for k, v in stats.items()}  # to numpy
+        for k in 'attr_preds', 'attr_targets':  # unpack attribute bits
+            stats[k] = np.unpackbits(stats[k], axis=1, count=self.num_attrs, bitorder='little').astype(bool)
+        if len(stats['tp']) and stats['tp'].any():
+            self.metrics.process(**stats)
+        self.nt_per_class = np.bincount(stats['target_cls'].astype(int), minlength=self.nc)  # targets per class
+        self.nt_per_attrs = np.sum(stats['attr_targets'], axis=0)  # number of targets per attribute
         return self.metrics.results_dict
     
     #TODO: check this
@@ -68,6 +68,50 @@ def box_iou(box1, box2, eps=1e-7):
     return inter / ((a2 - a1).prod(2) + (b2 - b1).prod(2) - inter + eps)
 
 
+def box_iou_2d(box1, box2, eps=1e-7):
+    """
+    Calculate pairwise IoU of (x1, y1, x2, y2) boxes using only 2D intermediates.
+
+    Equivalent to `box_iou`, but computes intersection width and height as separate (N, M) tensors updated in place
+    instead of broadcasting to an (N, M, 2) tensor.
+
+    Args:
+        box1 (torch.Tensor): A tensor of shape (N, 4) representing N bounding boxes.
+        box2 (torch.Tensor): A tensor of shape (M, 4) representing M bounding boxes.
+        eps (float, optional): A small value to avoid division by zero. Defaults to 1e-7.
+
+    Returns:
+        (torch.Tensor): An NxM tensor containing the pairwise IoU values for every element in box1 and box2.
+    """
+    area1 = (box1[:, 2] - box1[:, 0]) * (box1[:, 3] - box1[:, 1])
+    area2 = (box2[:, 2] - box2[:, 0]) * (box2[:, 3] - box2[:, 1])
+    w = torch.min(box1[:, None, 2], box2[:, 2]).sub_(torch.max(box1[:, None, 0], box2[:, 0])).clamp_(0)
+    h = torch.min(box1[:, None, 3], box2[:, 3]).sub_(torch.max(box1[:, None, 1], box2[:, 1])).clamp_(0)
+    inter = w.mul_(h)
+    return inter.div_(area1[:, None] + area2 - inter + eps)
+
+
+def box_iou_np(box1, box2, eps=1e-7):
+    """
+    NumPy version of `box_iou_2d` for CPU tensors, using ufunc outer products instead of broadcast torch ops.
+
+    Args:
+        box1 (torch.Tensor): A CPU tensor of shape (N, 4) representing N bounding boxes.
+        box2 (torch.Tensor): A CPU tensor of shape (M, 4) representing M bounding boxes.
+        eps (float, optional): A small value to avoid division by zero. Defaults to 1e-7.
+
+    Returns:
+        (torch.Tensor): An NxM tensor containing the pairwise IoU values for every element in box1 and box2.
+    """
+    a, b = box1.numpy(), box2.numpy()
+    area1 = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area2 = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    w = (np.minimum.outer(a[:, 2], b[:, 2]) - np.maximum.outer(a[:, 0], b[:, 0])).clip(0)
+    h = (np.minimum.outer(a[:, 3], b[:, 3]) - np.maximum.outer(a[:, 1], b[:, 1])).clip(0)
+    inter = w * h
+    return torch.from_numpy(inter / (area1[:, None] + area2 - inter + eps))
+
+
 def bbox_iou(box1, box2, xywh=True, GIoU=False, DIoU=False, CIoU=False, eps=1e-7):
     """
     Calculate Intersection over Union (IoU) of box1(1, 4) to box2(n, 4).
@@ -259,6 +303,53 @@ class ConfusionMatrix:
                 if not any(m1 == i):
                     self.matrix[dc, self.nc] += 1  # predicted background
 
+    def process_batch_multi(self, detections, labels, detection_image_ids, label_image_ids):
+        """
+        Update confusion matrix for object detection task with the detections and labels of several images at once.
+
+        Equivalent to calling `process_batch` once per image, but IoU matching runs on a single matrix with pairs from
+        different images masked out, and the matrix is updated with one `np.bincount` instead of per-box loops.
+
+        Args:
+            detections (Array[N, 6]): Detected bounding boxes and their associated information.
+                                      Each row should contain (x1, y1, x2, y2, conf, class).
+            labels (Array[M, 5]): Ground truth bounding boxes and their associated class labels.
+                                  Each row should contain (class, x1, y1, x2, y2).
+            detection_image_ids (Array[N]): Index of the image each detection belongs to.
+            label_image_ids (Array[M]): Index of the image each label belongs to.
+        """
+        keep = detections[:, 4] > self.conf
+        detections, detection_image_ids = detections[keep], detection_image_ids[keep]
+        gt_classes = labels[:, 0].int().cpu().numpy()
+        detection_classes = detections[:, 5].int().cpu().numpy()
+        iou = box_iou_2d(labels[:, 1:], detections[:, :4])
+        iou *= label_image_ids[:, None] == detection_image_ids  # only match within the same image
+
+        x = torch.where(iou > self.iou_thres)
+        matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).cpu().numpy()
+        if matches.shape[0] > 1:
+            matches = matches[matches[:, 2].argsort()[::-1]]
+            matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+            matches = matches[matches[:, 2].argsort()[::-1]]
+            matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+        m0, m1, _ = matches.transpose().astype(int)
+
+        # Labels: matched detection class (correct) or background (true background)
+        p = np.full_like(gt_classes, self.nc)
+        p[m0] = detection_classes[m1]
+        t = gt_classes
+
+        # Unmatched detections in images with at least one match: predicted background
+        matched_images = label_image_ids.cpu().numpy()[m0]
+        unmatched = np.ones(len(detection_classes), dtype=bool)
+        unmatched[m1] = False
+        unmatched &= np.isin(detection_image_ids.cpu().numpy(), matched_images)
+        p = np.concatenate((p, detection_classes[unmatched]))
+        t = np.concatenate((t, np.full(unmatched.sum(), self.nc)))
+
+        n = self.nc + 1
+        self.matrix += np.bincount(p * n + t, minlength=n * n).reshape(n, n)
+
     def matrix(self):
         """Returns the confusion matrix."""
         return self.matrix
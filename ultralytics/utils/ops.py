@@ -113,6 +113,24 @@ def scale_boxes(img1_shape, boxes, img0_shape, ratio_pad=None, padding=True):
     return boxes
 
 
+def scale_boxes_batch(boxes, ratio_pad):
+    """
+    Rescale (x1, y1, x2, y2) boxes from letterboxed image space to native image space, one row per box.
+
+    Vectorized equivalent of `scale_boxes` for boxes drawn from several images of a batch.
+
+    Args:
+        boxes (torch.Tensor): A tensor of shape (N, 4) representing N bounding boxes.
+        ratio_pad (torch.Tensor): A tensor of shape (N, 5) holding (gain, pad_w, pad_h, h0, w0) for each box.
+
+    Returns:
+        (torch.Tensor): A tensor of shape (N, 4) with the rescaled boxes clipped to the native image shape.
+    """
+    gain, pad, shape = ratio_pad[:, :1], ratio_pad[:, 1:3], ratio_pad[:, 3:]
+    boxes = (boxes - pad.repeat(1, 2)) / gain
+    return torch.min(boxes.clamp(min=0), shape.flip(1).repeat(1, 2))  # clip to (w0, h0, w0, h0)
+
+
 def make_divisible(x, divisor):
     """
     Returns the nearest number that is divisible by the given divisor.
@@ -402,6 +420,24 @@ def xywhn2xyxy(x, w=640, h=640, padw=0, padh=0):
     return y
 
 
+def xywhn2xyxy_batch(boxes, whwh, ratio_pad):
+    """
+    Convert normalized (x, y, w, h) boxes of a letterboxed batch to native-space (x1, y1, x2, y2) boxes.
+
+    Fuses `xywhn2xyxy` and `scale_boxes_batch` into a single function, which torch.compile lowers to one kernel.
+
+    Args:
+        boxes (torch.Tensor): A tensor of shape (N, 4) of boxes in normalized (x, y, w, h) format.
+        whwh (torch.Tensor): A tensor of shape (4,) holding the letterboxed image (w, h, w, h).
+        ratio_pad (torch.Tensor): A tensor of shape (N, 5) holding (gain, pad_w, pad_h, h0, w0) for each box.
+
+    Returns:
+        (torch.Tensor): A tensor of shape (N, 4) with the native-space boxes.
+    """
+    xy, wh = (boxes * whwh).chunk(2, 1)
+    return scale_boxes_batch(torch.cat((xy - wh / 2, xy + wh / 2), 1), ratio_pad)
+
+
 def xyxy2xywhn(x, w=640, h=640, clip=False, eps=0.0):
     """
     Convert bounding box coordinates from (x1, y1, x2, y2) format to (x, y, width, height, normalized) format. x, y,
@@ -26,6 +26,7 @@ except ImportError:
 
 TORCH_1_9 = check_version(torch.__version__, '1.9.0')
 TORCH_2_0 = check_version(torch.__version__, '2.0.0')
+TORCH_2_1 = check_version(torch.__version__, '2.1.0')
 
 
 @contextmanager